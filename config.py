@@ -2,11 +2,18 @@
 import os
 from pathlib import Path
 
+from env import load_env
+
+# Settings read os.environ at class creation, so .env must be loaded first
+load_env()
+
 
 class Settings:
     # Tesseract config
     TESSERACT_CMD: str = os.getenv("TESSERACT_CMD", r"C:\Program Files\Tesseract-OCR\tesseract.exe")
     TESSERACT_LANG: str = os.getenv("TESSERACT_LANG", "eng")
+    # tessdata folder for the in-process tesserocr API (empty = its built-in default)
+    TESSDATA_PATH: str = os.getenv("TESSDATA_PATH", "")
 
     # Local Google Drive base (Desktop client)
     # Example: G:\My Drive
@@ -15,13 +22,32 @@ class Settings:
     # Optional cache dir
     DOWNLOAD_ROOT_DIR: str = os.getenv("DOWNLOAD_ROOT_DIR", "data/downloads")
 
+    # SQLite cache of OCR + LLM results keyed by image content hash
+    RESULT_CACHE_PATH: str = os.getenv(
+        "RESULT_CACHE_PATH", os.path.join(DOWNLOAD_ROOT_DIR, "result_cache.sqlite3")
+    )
+
     # Ollama config
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama3.1")
 
+    # Together AI config
+    TOGETHER_MODEL: str = os.getenv("TOGETHER_MODEL", "google/gemma-3n-E4B-it")
+
     # OCR tuning
     TESSERACT_PSM: int = int(os.getenv("TESSERACT_PSM", "6"))
     TESSERACT_OEM: int = int(os.getenv("TESSERACT_OEM", "3"))
 
+    # Pipeline stage sizes: Tesseract runs and LLM calls in flight at once
+    OCR_CONCURRENCY: int = int(os.getenv("OCR_CONCURRENCY", str(os.cpu_count() or 1)))
+    LLM_CONCURRENCY: int = int(os.getenv("LLM_CONCURRENCY", "4"))
+    # Folder pipeline runs at once across all requests (each uses the pools above)
+    GLOBAL_OCR_CONCURRENCY: int = int(os.getenv("GLOBAL_OCR_CONCURRENCY", "1"))
+
+    # LLM micro-batching: up to LLM_BATCH_SIZE OCR texts per request, waiting at
+    # most LLM_BATCH_WAIT_MS for a batch to fill (1 disables batching)
+    LLM_BATCH_SIZE: int = int(os.getenv("LLM_BATCH_SIZE", "8"))
+    LLM_BATCH_WAIT_MS: int = int(os.getenv("LLM_BATCH_WAIT_MS", "100"))
+
 
 settings = Settings()
@@ -0,0 +1,17 @@
+# env.py
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+
+@lru_cache(maxsize=1)
+def load_env() -> os._Environ:
+    """
+    Load .env into os.environ once per process.
+    Every module calls this instead of load_dotenv(); only the first call parses the file.
+    """
+    load_dotenv()
+    return os.environ
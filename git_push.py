@@ -2,6 +2,23 @@ import base64
 import json
 import requests
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+
+# One keep-alive session for all GitHub API calls, so repeated pushes reuse
+# the TCP/TLS connection to api.github.com instead of handshaking each time.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+_session.headers.update({"Accept": "application/vnd.github+json"})
+
+# "<content url>@<branch>" -> blob SHA from our last successful push,
+# so repeated updates of the same file can skip the lookup GET.
+_sha_cache: dict = {}
+
+
+def _fetch_sha(url: str, headers: dict):
+    response = _session.get(url, headers=headers)
+    return response.json().get("sha") if response.status_code == 200 else None
 
 
 def push_excel_to_github(
@@ -11,27 +28,33 @@ def push_excel_to_github(
     repo: str,
     repo_file_path: str,
     branch: str = "main",
-    commit_message: str = "Auto update leaderboard"
+    commit_message: str = "Auto update leaderboard",
+    check_exists: bool = True,
 ) -> str:
     """
     Push an Excel file to GitHub (create or update).
 
+    check_exists=False skips the SHA lookup for files known to be new
+    (e.g. timestamped exports); if the file does exist after all, the push
+    falls back to looking up the SHA and retrying.
+
     Returns: GitHub API content URL
     """
 
     headers = {
         "Authorization": f"token {github_token}",
-        "Accept": "application/vnd.github+json"
     }
 
     # Step 1: Check if file already exists (to get SHA)
     url = f"https://api.github.com/repos/{owner}/{repo}/contents/{repo_file_path}"
-    response = requests.get(url, headers=headers)
+    cache_key = f"{url}@{branch}"
 
-    sha = response.json().get("sha") if response.status_code == 200 else None
+    sha = None
+    if check_exists:
+        sha = _sha_cache.get(cache_key) or _fetch_sha(url, headers)
 
     # Step 2: Read & encode file
-    content = base64.b64encode(Path(local_file_path).read_bytes()).decode("utf-8")
+    content = base64.b64encode(Path(local_file_path).read_bytes()).decode("ascii")
 
     payload = {
         "message": commit_message,
@@ -43,7 +66,18 @@ def push_excel_to_github(
         payload["sha"] = sha
 
     # Step 3: Push file
-    push_response = requests.put(url, headers=headers, data=json.dumps(payload))
+    push_response = _session.put(url, headers=headers, data=json.dumps(payload))
+
+    # 422: file exists but no SHA was sent; 409: cached SHA is stale
+    if push_response.status_code in (409, 422):
+        sha = _fetch_sha(url, headers)
+        if sha:
+            payload["sha"] = sha
+            push_response = _session.put(url, headers=headers, data=json.dumps(payload))
+
     push_response.raise_for_status()
 
-    return push_response.json()["content"]["html_url"]
+    pushed = push_response.json()["content"]
+    _sha_cache[cache_key] = pushed["sha"]
+
+    return pushed["html_url"]
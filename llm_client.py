@@ -2,34 +2,48 @@
 
 from __future__ import annotations
 
-import json
+import re
+from functools import lru_cache
+from typing import Callable, List, TypeVar
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 
 from config import settings
 from models import HealthData
+import together
 from together import Together
 import os
 
-from dotenv import load_dotenv
-load_dotenv()
+from env import load_env
+load_env()
 
 class LLMExtractionError(Exception):
     pass
 
 
-def build_extraction_prompt(text: str) -> str:
-
-    print(f"llm text === {text}")
+class RateLimitError(LLMExtractionError):
     """
-    Ask the model to extract numeric metrics + workout_type.
-    workout_type must be one of: sport, strength_training, cardio, yoga.
-    If unsure, choose the closest category; use null only if absolutely no workout is implied.
+    The LLM provider rejected the call for rate limit / quota (HTTP 429).
     """
-    return f"""
-    Return ONLY valid JSON. No text, no markdown, no explanations.
 
-    From the text below, extract the following fields:
+
+_DIGIT_RE = re.compile(r"\d")
+
+
+# Workout points mapping
+_WORKOUT_POINTS = {
+    "sport": 300,                # Any Sport
+    "strength_training": 300,    # Strength Training/HIIT
+    "cardio": 200,               # Cardio
+    "yoga": 200                  # Yoga
+}
+
+
+# Field list + workout_type rules shared by the single and batch prompts
+_EXTRACTION_RULES = """
     - steps (number, 0 if not available)
     - calories_kcal (number, 0 if not available)
     - distance_km (number, 0 if not available)
@@ -44,21 +58,87 @@ def build_extraction_prompt(text: str) -> str:
     - null: if no workout described
     - IMPORTANT if you are not clear about the workout type, then make it null.
     - IMPORTANT if there is no walking or steps mentioned, make steps 0.
-    - IMPORTANT if there is no Workout_type and only Steps mentioned then workout_type should be null.
+    - IMPORTANT if there is no Workout_type and only Steps mentioned then workout_type should be null."""
+
+# Static extraction prompt, built once; the OCR text is the only substitution.
+_EXTRACTION_PROMPT_TEMPLATE = ("""
+    Return ONLY valid JSON. No text, no markdown, no explanations.
+
+    From the text below, extract the following fields:""" + _EXTRACTION_RULES + """
 
     Text:
-    {text}
+    %s
 
     JSON ONLY. Example of correct format:
 
-    {{
+    {
       "steps": 7672,
       "calories_kcal": null,
       "distance_km": 5.54,
       "active_time_minutes": 75.56,
       "workout_type": "cardio"
-    }}
-    """.strip()
+    }
+    """).strip()
+
+# Several OCR texts in one request; substitutions: count, texts, count.
+_BATCH_EXTRACTION_PROMPT_TEMPLATE = ("""
+    Return ONLY valid JSON. No text, no markdown, no explanations.
+
+    Below are %d separate texts, each starting with a line "### Text <n>".
+    From EACH text, independently, extract the following fields:""" + _EXTRACTION_RULES + """
+
+    Texts:
+    %s
+
+    JSON ONLY: an array with exactly %d objects, one per text, in the same order.
+    Each object also has "text": the <n> of the "### Text <n>" it was extracted from.
+    Example of correct format for 2 texts:
+
+    [
+      {
+        "text": 1,
+        "steps": 7672,
+        "calories_kcal": null,
+        "distance_km": 5.54,
+        "active_time_minutes": 75.56,
+        "workout_type": "cardio"
+      },
+      {
+        "text": 2,
+        "steps": 0,
+        "calories_kcal": 320,
+        "distance_km": null,
+        "active_time_minutes": 45,
+        "workout_type": "strength_training"
+      }
+    ]
+    """).strip()
+
+
+def build_extraction_prompt(text: str) -> str:
+    """
+    Ask the model to extract numeric metrics + workout_type.
+    workout_type must be one of: sport, strength_training, cardio, yoga.
+    If unsure, choose the closest category; use null only if absolutely no workout is implied.
+    """
+    return _EXTRACTION_PROMPT_TEMPLATE % text
+
+
+def build_batch_extraction_prompt(texts: List[str]) -> str:
+    """
+    Same extraction as build_extraction_prompt, for several OCR texts at once;
+    the model must answer with a JSON array in input order, each object
+    echoing its text number in "text".
+    """
+    numbered = "\n\n".join(f"### Text {i}\n{text}" for i, text in enumerate(texts, start=1))
+    return _BATCH_EXTRACTION_PROMPT_TEMPLATE % (len(texts), numbered, len(texts))
+
+
+# One keep-alive session for Ollama calls, pooled for the concurrent LLM workers
+_ollama_session = requests.Session()
+_ollama_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, settings.LLM_CONCURRENCY))
+_ollama_session.mount("http://", _ollama_adapter)
+_ollama_session.mount("https://", _ollama_adapter)
 
 
 def call_ollama(prompt: str) -> str:
@@ -70,7 +150,7 @@ def call_ollama(prompt: str) -> str:
     }
     print("Calling Ollama with prompt:")
     print(prompt)
-    resp = requests.post(url, json=payload, timeout=60)
+    resp = _ollama_session.post(url, json=payload, timeout=60)
     resp.raise_for_status()
     data = resp.json()
 
@@ -79,11 +159,16 @@ def call_ollama(prompt: str) -> str:
     return raw.strip()
 
 
-def call_togather_ai(prompt: str) -> str:
-    client = Together(api_key=os.getenv("TOGETHER_API_KEY"))
+@lru_cache(maxsize=1)
+def _together_client() -> Together:
+    # Built once on first use and reused, so every image shares one client
+    # (and its connection pool) instead of re-reading the key per call.
+    return Together(api_key=os.getenv("TOGETHER_API_KEY"))
+
 
-    response = client.chat.completions.create(
-        model="google/gemma-3n-E4B-it",
+def call_togather_ai(prompt: str, model: str = settings.TOGETHER_MODEL) -> str:
+    response = _together_client().chat.completions.create(
+        model=model,
         messages=[
             {
                 "role": "user",
@@ -95,6 +180,86 @@ def call_togather_ai(prompt: str) -> str:
     return response.choices[0].message.content.strip()
 
 
+T = TypeVar("T")
+
+_RATE_LIMIT_RE = re.compile(r"\b429\b|rate.?limit|quota", re.IGNORECASE)
+
+# Together SDK network errors, looked up by name: together>=2 exports them at
+# the top level (APITimeoutError subclasses APIConnectionError), together<2
+# in together.error (Timeout, ServiceUnavailableError)
+try:
+    from together import error as _together_error  # together < 2
+except ImportError:
+    _together_error = None
+
+_TOGETHER_NETWORK_ERRORS = tuple(
+    {
+        cls
+        for module in (together, _together_error)
+        for cls in (
+            getattr(module, name, None)
+            for name in ("APIConnectionError", "APITimeoutError", "Timeout", "ServiceUnavailableError")
+        )
+        if isinstance(cls, type) and issubclass(cls, BaseException)
+    }
+)
+
+_RETRY_WAIT = wait_exponential(min=1, max=10)
+_RATE_LIMIT_WAIT = wait_exponential(multiplier=5, min=5, max=60)
+
+
+def _status_code(e: BaseException):
+    # together>=2: status_code, together<2: http_status
+    return (
+        getattr(e, "status_code", None)
+        or getattr(e, "http_status", None)
+        or getattr(getattr(e, "response", None), "status_code", None)
+    )
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    status = _status_code(e)
+    if status is not None:
+        return status == 429
+    # No status code to go on: fall back to the error text
+    return bool(_RATE_LIMIT_RE.search(str(e)))
+
+
+def _is_retryable(e: BaseException) -> bool:
+    # Worth another attempt: unparseable answers / rate limits, network blips, 5xx
+    if isinstance(e, (LLMExtractionError, ConnectionError, TimeoutError) + _TOGETHER_NETWORK_ERRORS):
+        return True
+    status = _status_code(e)
+    return isinstance(status, int) and status >= 500
+
+
+def _retry_wait(retry_state) -> float:
+    # Rate limits need longer to clear than a dropped connection
+    if isinstance(retry_state.outcome.exception(), RateLimitError):
+        return _RATE_LIMIT_WAIT(retry_state)
+    return _RETRY_WAIT(retry_state)
+
+
+@retry(
+    retry=retry_if_exception(_is_retryable),
+    wait=_retry_wait,
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+def _complete(prompt: str, parse: Callable[[str], T]) -> T:
+    """
+    Call the LLM and parse its answer, up to 3 attempts with exponential backoff.
+    The last error is re-raised once the attempts are used up.
+    """
+    try:
+        raw = call_togather_ai(prompt)
+    except Exception as e:
+        if _is_rate_limited(e):
+            raise RateLimitError(str(e)) from e
+        raise
+    return parse(raw)
+
+
 def parse_health_json(raw: str) -> HealthData:
     """
     Parse raw LLM output as JSON and coerce into HealthData.
@@ -109,10 +274,47 @@ def parse_health_json(raw: str) -> HealthData:
     json_str = raw[start : end + 1]
 
     try:
-        obj = json.loads(json_str)
-    except json.JSONDecodeError as e:
+        obj = orjson.loads(json_str)
+    except orjson.JSONDecodeError as e:
         raise LLMExtractionError(f"Invalid JSON from LLM: {e} | raw={raw[:200]}") from e
 
+    return health_from_json_obj(obj)
+
+
+def parse_health_json_array(raw: str, expected: int) -> List[HealthData]:
+    """
+    Parse a batched LLM answer: a JSON array of exactly `expected` objects
+    whose "text" numbers are 1..expected in order.
+    Anything else raises LLMExtractionError so the caller can fall back.
+    """
+    start = raw.find("[")
+    end = raw.rfind("]")
+    if start == -1 or end == -1 or start > end:
+        raise LLMExtractionError(f"Could not find JSON array in response: {raw[:200]}")
+
+    try:
+        items = orjson.loads(raw[start : end + 1])
+    except orjson.JSONDecodeError as e:
+        raise LLMExtractionError(f"Invalid JSON from LLM: {e} | raw={raw[:200]}") from e
+
+    if len(items) != expected or not all(isinstance(obj, dict) for obj in items):
+        raise LLMExtractionError(
+            f"Expected {expected} JSON objects from LLM, got: {raw[:200]}"
+        )
+
+    # A reordered, merged or split answer would credit stats to the wrong image
+    if [obj.get("text") for obj in items] != list(range(1, expected + 1)):
+        raise LLMExtractionError(
+            f"LLM answer does not match texts 1..{expected} in order: {raw[:200]}"
+        )
+
+    return [health_from_json_obj(obj) for obj in items]
+
+
+def health_from_json_obj(obj: dict) -> HealthData:
+    """
+    Coerce one parsed LLM JSON object into HealthData.
+    """
     # Defensive conversion to correct types
     def to_int(v):
         if v is None:
@@ -147,69 +349,78 @@ def parse_health_json(raw: str) -> HealthData:
             v_norm = aliases[v_norm]
         return v_norm if v_norm in allowed else None
 
-    steps1 = to_int(obj.get("steps"))
+    steps = to_int(obj.get("steps"))
+
+    # Cap implausible step counts (usually OCR/LLM misreads)
+    if steps is not None and steps > 40000:
+        steps = 20000
 
-    if steps1 is not None and steps1 > 40000:
-        steps1 = 20000
-    else:
-        steps1 = 0
+    workout_type = normalize_workout_type(obj.get("workout_type"))
 
-    health = HealthData(
-        steps=steps1,
+    # Every field is already coerced above, so skip pydantic re-validation
+    health = HealthData.model_construct(
+        steps=steps,
         calories_kcal=to_float(obj.get("calories_kcal")),
         distance_km=to_float(obj.get("distance_km")),
         active_time_minutes=to_float(obj.get("active_time_minutes")),
-        workout_type=normalize_workout_type(obj.get("workout_type")),
-        total_points=calculate_points(to_int(obj.get("steps")), normalize_workout_type(obj.get("workout_type")))
+        workout_type=workout_type,
+        total_points=calculate_points(steps, workout_type)
     )
     return health
 
 
 def extract_health_data_from_text(text: str) -> HealthData:
-    # Guard clause: skip LLM if OCR text is empty
-    if not text or not text.strip():
+    # Guard clause: skip LLM if OCR text is empty or has no digits at all
+    if not _needs_llm(text):
         return empty_health_data()
 
     prompt = build_extraction_prompt(text)
     #raw = call_ollama(prompt)
-    raw = call_togather_ai(prompt)
-    health = parse_health_json(raw)
+    health = _complete(prompt, parse_health_json)
     return health
 
+def _needs_llm(text: str) -> bool:
+    # Empty OCR text, or text without a single digit, has no stats to extract
+    return bool(text and text.strip() and _DIGIT_RE.search(text))
+
+
+def extract_health_data_batch(texts: List[str]) -> List[HealthData]:
+    """
+    Extract health data for several OCR texts with a single LLM call.
+    Texts without stats short-circuit to empty_health_data() as in
+    extract_health_data_from_text. If the batched answer cannot be matched
+    back to the inputs, falls back to one call per text.
+    """
+    results: List[HealthData] = [empty_health_data() for _ in texts]
+    todo = [i for i, text in enumerate(texts) if _needs_llm(text)]
+
+    if len(todo) == 1:
+        results[todo[0]] = extract_health_data_from_text(texts[todo[0]])
+    elif todo:
+        # Only the call is retried here; an unusable batch answer falls back below
+        raw = _complete(build_batch_extraction_prompt([texts[i] for i in todo]), str)
+        try:
+            parsed = parse_health_json_array(raw, len(todo))
+        except LLMExtractionError:
+            parsed = [extract_health_data_from_text(texts[i]) for i in todo]
+        for i, health in zip(todo, parsed):
+            results[i] = health
+
+    return results
+
+
 def empty_health_data() -> HealthData:
-    return HealthData(
+    return HealthData.model_construct(
         steps=0,
-        calories_kcal=0,
-        distance_km=0,
-        active_time_minutes=0,
+        calories_kcal=0.0,
+        distance_km=0.0,
+        active_time_minutes=0.0,
         workout_type='',
         total_points=0
     )
 
 def calculate_points(steps: int = 0 , workout_type: str = '') -> int:
-    # Workout points mapping
-    workout_points = {
-        "sport": 300,                # Any Sport
-        "strength_training": 300,    # Strength Training/HIIT
-        "cardio": 200,               # Cardio
-        "yoga": 200                  # Yoga
-    }
-
-    # Step points calculation
-    if steps <= 5000:
-        step_points = 25
-    elif steps <= 8000:
-        step_points = 35
-    elif steps <= 10000:
-        step_points = 80
-    elif steps <= 15000:
-        step_points = 150
-    elif steps <= 20000:
-        step_points = 300
-    else:
-        step_points = 500
-
+    # Step points are added per user after aggregation (see db.step_points_for),
+    # so a single image only scores its workout.
     # Workout points (0 if no valid workout)
-    workout_score = workout_points.get(workout_type, 0)
-
-    return workout_score
+    return _WORKOUT_POINTS.get(workout_type, 0)
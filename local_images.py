@@ -1,12 +1,16 @@
 # app/local_images.py
 from __future__ import annotations
 
+import os
 from pathlib import Path
 from typing import List
 
 from config import settings
 
 
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".heic"}
+
+
 def get_local_folder_path(folder_name: str) -> Path:
     """
     Build absolute path for a given date folder under Google Drive Desktop.
@@ -28,11 +32,11 @@ def list_folder_images(folder_name: str) -> List[Path]:
     if not folder_path.exists() or not folder_path.is_dir():
         raise FileNotFoundError(f"Folder not found: {folder_path}")
 
-    exts = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".heic"}
-
-    image_paths: List[Path] = []
-    for p in folder_path.iterdir():
-        if p.is_file() and p.suffix.lower() in exts:
-            image_paths.append(p)
-
-    return image_paths
+    # DirEntry.is_file() uses the file type from the directory read itself,
+    # so no extra stat() per entry.
+    with os.scandir(folder_path) as entries:
+        return [
+            Path(entry.path)
+            for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+        ]
@@ -1,21 +1,23 @@
 # main.py
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Set
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
+from openpyxl.utils import column_index_from_string
 
 import pandas as pd
 from pydantic import BaseModel
 
 from config import settings
 from local_images import list_folder_images
-from ocr import ocr_image
-from llm_client import extract_health_data_from_text, LLMExtractionError
+from pipeline import image_content_hash, run_folder_pipeline, run_pipeline
 from models import (
     ProcessFolderRequest,
     ProcessFolderResponse,
@@ -23,7 +25,6 @@ from models import (
 )
 from db import (
     create_tables,
-    save_results_to_db,
     FitIn50Workout,
     get_db, update_results_to_excel, generate_daily_summary,
 )
@@ -33,6 +34,8 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
 )
 logger = logging.getLogger("fitin50")
+# Explicit, so per-image DEBUG lines stay off even if the root level is lowered
+logger.setLevel(logging.INFO)
 
 app = FastAPI(
     title="FitIn50 OCR API",
@@ -59,6 +62,19 @@ class UpdateFolderResponse(BaseModel):
     results: List[ImageResult]
 
 
+# Bounds blocking pipeline runs across requests; the event loop stays free meanwhile
+_pipeline_slots = asyncio.Semaphore(settings.GLOBAL_OCR_CONCURRENCY)
+
+
+async def _run_blocking(fn, *args):
+    """
+    Run blocking OCR/LLM/Excel work in a worker thread,
+    at most settings.GLOBAL_OCR_CONCURRENCY at a time.
+    """
+    async with _pipeline_slots:
+        return await asyncio.to_thread(fn, *args)
+
+
 #@app.on_event("startup")
 # def on_startup():
 #     # Ensure tables exist (optional if you run SQL manually)
@@ -67,7 +83,7 @@ class UpdateFolderResponse(BaseModel):
 
 
 @app.post("/process-folder", response_model=ProcessFolderResponse)
-def process_folder(req: ProcessFolderRequest):
+async def process_folder(req: ProcessFolderRequest):
     """
     1. Read all image files from local Google Drive Desktop folder:
          <LOCAL_DRIVE_BASE>/<folder_name>
@@ -77,86 +93,10 @@ def process_folder(req: ProcessFolderRequest):
     4. Store each image result as a row in Postgres.
     5. Return structured response.
     """
-    folder_name = req.folder_name
-
-    try:
-        logger.info("Listing images for local folder_name=%s", folder_name)
-        image_paths: List[Path] = list_folder_images(folder_name)
-    except FileNotFoundError as e:
-        logger.warning("Folder not found: %s", e)
-        raise HTTPException(status_code=404, detail=str(e))
-    except Exception as e:
-        logger.exception("Failed to list images from local folder")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error reading local folder: {e}",
-        )
-
-    if not image_paths:
-        logger.warning("No images found for folder_name=%s", folder_name)
-        return ProcessFolderResponse(
-            folder_name=folder_name,
-            images_processed=0,
-            results=[],
-        )
-
-    results: List[ImageResult] = []
-
-    for img_path in image_paths:
-        logger.info("Processing image: %s", img_path)
-        try:
-            text = ocr_image(img_path)
-        except Exception:
-            logger.exception("OCR failed for image %s", img_path)
-            # Skip this image; continue with others
-            continue
-
-        try:
-            health_data = extract_health_data_from_text(text)
-        except LLMExtractionError as e:
-            logger.warning("LLM extraction failed for image %s: %s", img_path, e)
-            raise HTTPException(
-                status_code=500,
-                detail=f"LLM JSON extraction failed for image {img_path.name}: {e}",
-            )
-        except Exception as e:
-            logger.exception("Unexpected LLM error for image %s", img_path)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Unexpected LLM error for image {img_path.name}: {e}",
-            )
-
-        results.append(
-            ImageResult(
-                filename=img_path.name,
-                raw_text=text,
-                health_data=health_data,
-            )
-        )
-
-    #Save to Postgres
-    try:
-        inserted_ids = save_results_to_db(folder_name, results)
-        logger.info(
-            "Saved %d rows to Postgres for folder_name=%s",
-            len(inserted_ids),
-            folder_name,
-        )
-    except Exception as e:
-        logger.exception("Failed to save results to Postgres")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error saving results to database: {e}",
-        )
-
-    return ProcessFolderResponse(
-        folder_name=folder_name,
-        images_processed=len(results),
-        results=results,
-    )
+    return await _run_blocking(run_folder_pipeline, req.folder_name, req.include_raw)
 
 @app.post("/update_total_points", response_model=ProcessFolderResponse)
-def update_total_points(req: ProcessFolderRequest):
+async def update_total_points(req: ProcessFolderRequest):
     """
        1. Read all image files from local Google Drive Desktop folder:
             <LOCAL_DRIVE_BASE>/<folder_name>
@@ -166,88 +106,12 @@ def update_total_points(req: ProcessFolderRequest):
        4. Store each image result as a row in Postgres.
        5. Return structured response.
        """
-    folder_name = req.folder_name
-
-    try:
-        logger.info("Listing images for local folder_name=%s", folder_name)
-        image_paths: List[Path] = list_folder_images(folder_name)
-    except FileNotFoundError as e:
-        logger.warning("Folder not found: %s", e)
-        raise HTTPException(status_code=404, detail=str(e))
-    except Exception as e:
-        logger.exception("Failed to list images from local folder")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error reading local folder: {e}",
-        )
-
-    if not image_paths:
-        logger.warning("No images found for folder_name=%s", folder_name)
-        return ProcessFolderResponse(
-            folder_name=folder_name,
-            images_processed=0,
-            results=[],
-        )
-
-    results: List[ImageResult] = []
-
-    for img_path in image_paths:
-        logger.info("Processing image: %s", img_path)
-        try:
-            text = ocr_image(img_path)
-        except Exception:
-            logger.exception("OCR failed for image %s", img_path)
-            # Skip this image; continue with others
-            continue
-
-        try:
-            health_data = extract_health_data_from_text(text)
-        except LLMExtractionError as e:
-            logger.warning("LLM extraction failed for image %s: %s", img_path, e)
-            raise HTTPException(
-                status_code=500,
-                detail=f"LLM JSON extraction failed for image {img_path.name}: {e}",
-            )
-        except Exception as e:
-            logger.exception("Unexpected LLM error for image %s", img_path)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Unexpected LLM error for image {img_path.name}: {e}",
-            )
-
-        results.append(
-            ImageResult(
-                filename=img_path.name,
-                raw_text=text,
-                health_data=health_data,
-            )
-        )
-
-    # Save to Postgres
-    try:
-        inserted_ids = save_results_to_db(folder_name, results)
-        logger.info(
-            "Saved %d rows to Postgres for folder_name=%s",
-            len(inserted_ids),
-            folder_name,
-        )
-    except Exception as e:
-        logger.exception("Failed to save results to Postgres")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error saving results to database: {e}",
-        )
-
-    return ProcessFolderResponse(
-        folder_name=folder_name,
-        images_processed=len(results),
-        results=results,
-    )
+    return await _run_blocking(run_folder_pipeline, req.folder_name, req.include_raw)
 
 
 
 @app.post("/update-folder", response_model=UpdateFolderResponse)
-def update_folder(req: UpdateFolderRequest):
+async def update_folder(req: UpdateFolderRequest):
     """
     1. Go to destination folder: req.destination_folder
        - Find Excel file starting with "fitness"
@@ -260,13 +124,24 @@ def update_folder(req: UpdateFolderRequest):
     4. Save Excel file.
     5. Return updated results.
     """
+    return await _run_blocking(_update_folder, req)
+
+
+def _update_folder(req: UpdateFolderRequest) -> UpdateFolderResponse:
+    """
+    Blocking body of /update-folder; runs in a worker thread.
+    """
     source_folder = req.folder_name
     dest_folder = "C:\\Data\\fitin50\\project\\fitin50-api\\data\\2026-01-26"
 
     # ---- FIND FITNESS EXCEL IN DESTINATION ----
     try:
         logger.info("Listing files at destination_folder=%s", dest_folder)
-        dest_files = list_local_files(dest_folder)
+        # Find a file that starts with "fitness" (case insensitive)
+        fitness_file_name = find_local_file(
+            dest_folder,
+            lambda name: name.lower().startswith("fitness") and name.endswith(".xlsx"),
+        )
     except FileNotFoundError as e:
         logger.warning("Destination folder not found: %s", e)
         raise HTTPException(status_code=404, detail=str(e))
@@ -277,12 +152,6 @@ def update_folder(req: UpdateFolderRequest):
             detail=f"Error reading destination folder: {e}",
         )
 
-    # Find a file that starts with "fitness" (case insensitive)
-    fitness_file_name = next(
-        (f for f in dest_files if f.lower().startswith("fitness") and f.endswith(".xlsx")),
-        None,
-    )
-
     if not fitness_file_name:
         logger.warning("No fitness excel file found in destination")
         raise HTTPException(
@@ -293,15 +162,18 @@ def update_folder(req: UpdateFolderRequest):
     fitness_file_path = Path(dest_folder) / fitness_file_name
 
     # ---- LOAD EXCEL & READ EXISTING IMAGES ----
+    workbook = None
     try:
         workbook = open_workbook(fitness_file_path)
         sheet = get_excel_sheet(workbook, "Daily Data")
+        processed_set = read_column_values(sheet, col="B")  # set of image names
     except Exception as e:
         logger.exception("Failed to read fitness excel or sheet")
         raise HTTPException(status_code=500, detail=str(e))
-
-    processed_images = read_column_values(sheet, col="B")  # list of image names
-    processed_set = set(processed_images)
+    finally:
+        # read-only workbooks keep the file open until closed
+        if workbook is not None:
+            workbook.close()
 
     # ---- LIST IMAGES IN SOURCE ----
     try:
@@ -326,46 +198,39 @@ def update_folder(req: UpdateFolderRequest):
             results=[],
         )
 
-    results: List[ImageResult] = []
-
     # ---- PROCESS NEW IMAGES ----
+    unseen_paths: List[Path] = []
+    seen_hashes: Set[str] = set()
     for img_path in image_paths:
-        img_name = img_path.name
-
-        if img_name in processed_set:
-            logger.info("Skipping already processed image: %s", img_name)
+        if img_path.name in processed_set:
+            logger.debug("Skipping already processed image: %s", img_path.name)
+            content_hash = image_content_hash(img_path)
+            if content_hash:
+                seen_hashes.add(content_hash)
             continue
-
-        logger.info("Processing new image: %s", img_path)
-
-        try:
-            text = ocr_image(img_path)
-        except Exception:
-            logger.exception("OCR failed for image %s", img_path)
-            # Skip this image
+        unseen_paths.append(img_path)
+
+    # A renamed copy of an image (same bytes, new name) is skipped too
+    new_image_paths: List[Path] = []
+    for img_path in unseen_paths:
+        content_hash = image_content_hash(img_path)
+        if content_hash in seen_hashes:
+            logger.debug("Skipping duplicate of an already processed image: %s", img_path.name)
             continue
+        if content_hash:
+            seen_hashes.add(content_hash)
+        new_image_paths.append(img_path)
+
+    results: List[ImageResult] = run_pipeline(new_image_paths)
 
-        try:
-            health_data = extract_health_data_from_text(text)
-        except LLMExtractionError as e:
-            logger.warning("LLM extraction failed for image %s: %s", img_path, e)
-            raise HTTPException(
-                status_code=500,
-                detail=f"LLM JSON extraction failed for {img_name}: {e}",
-            )
-        except Exception as e:
-            logger.exception("Unexpected LLM error for image %s", img_name)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Unexpected LLM error for {img_name}: {e}",
-            )
-
-        results.append(
-            ImageResult(
-                filename=img_name,
-                raw_text=text,
-                health_data=health_data,
-            )
+    if not results:
+        # Nothing to add: leave the workbook (and its summary) untouched
+        logger.info("No new images to add for source folder=%s", source_folder)
+        return UpdateFolderResponse(
+            folder_name=source_folder,
+            destination_folder=dest_folder,
+            new_images_processed=0,
+            results=[],
         )
 
     # ---- SAVE UPDATED EXCEL ----
@@ -395,18 +260,33 @@ def update_folder(req: UpdateFolderRequest):
         results=results,
     )
 
-def list_local_files(folder: str) -> List[str]:
-    return [f.name for f in Path(folder).iterdir() if f.is_file()]
+def find_local_file(folder: str, match) -> Optional[str]:
+    """
+    Name of the first file in folder for which match(name) is true, or None.
+    Stops scanning at the first hit.
+    """
+    with os.scandir(folder) as entries:
+        for e in entries:
+            if match(e.name) and e.is_file():
+                return e.name
+    return None
 
 def open_workbook(path: Path):
     import openpyxl
-    return openpyxl.load_workbook(path)
+    # Lookup only: read_only streams cells without building the full workbook
+    return openpyxl.load_workbook(path, read_only=True, data_only=True)
 
 def get_excel_sheet(workbook, sheet_name: str):
     return workbook[sheet_name]
 
-def read_column_values(sheet, col: str) -> List[str]:
-    return [cell.value for cell in sheet[col] if cell.value]
+def read_column_values(sheet, col: str) -> Set[str]:
+    # Only that column, as raw values: no Cell objects or style lookups
+    idx = column_index_from_string(col)
+    return {
+        value
+        for (value,) in sheet.iter_rows(min_col=idx, max_col=idx, values_only=True)
+        if value
+    }
 
 def append_row_to_sheet(sheet, values: List):
     sheet.append(values)
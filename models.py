@@ -27,6 +27,10 @@ class ProcessFolderRequest(BaseModel):
         ...,
         description="Local folder name under Google Drive Desktop (e.g. 06-01-2026)",
     )
+    include_raw: bool = Field(
+        False,
+        description="Include each image's OCR raw_text in the response",
+    )
 
 
 class ProcessFolderResponse(BaseModel):
@@ -1,18 +1,30 @@
 # app/ocr.py
 from __future__ import annotations
 
+import threading
 from pathlib import Path
 from typing import Optional
 
+import cv2
+import numpy as np
 import pytesseract
 from PIL import Image, ImageOps
 
 from config import settings
 
+try:
+    import tesserocr
+except ImportError:  # optional: without it every image runs the tesseract binary
+    tesserocr = None
+
 
 # Configure Tesseract binary path
 pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
 
+# Tesseract options, built once instead of per image
+_TESS_LANG = settings.TESSERACT_LANG
+_TESS_CONFIG = f"--psm {settings.TESSERACT_PSM} --oem {settings.TESSERACT_OEM}"
+
 
 def _preprocess_image(image: Image.Image) -> Image.Image:
     """
@@ -25,17 +37,73 @@ def _preprocess_image(image: Image.Image) -> Image.Image:
     return gray
 
 
+_JPEG_EXTENSIONS = {".jpg", ".jpeg"}
+# JPEGs larger than this decode at a reduced scale; smaller ones at full size
+_JPEG_DRAFT_SIZE = (2000, 2000)
+
+
+def _load_grayscale(image_path: Path):
+    """
+    Decode straight to 8-bit grayscale instead of a full-color decode
+    followed by a grayscale copy:
+    - JPEG: PIL draft mode, so libjpeg outputs grayscale and, for very large
+      images, decodes at a 1/2..1/8 DCT scale no smaller than _JPEG_DRAFT_SIZE.
+    - Other formats: OpenCV (libpng etc.).
+    Falls back to PIL for formats OpenCV can't decode (e.g. HEIC).
+    """
+    if Path(image_path).suffix.lower() in _JPEG_EXTENSIONS:
+        img = Image.open(image_path)
+        img.draft("L", _JPEG_DRAFT_SIZE)  # no-op if the file isn't really a JPEG
+        img.load()
+        return img if img.mode == "L" else _preprocess_image(img)
+
+    # fromfile + imdecode rather than imread: imread can't open non-ASCII paths on Windows.
+    # Orientation is ignored to get the same pixels as the PIL path.
+    data = np.fromfile(str(image_path), dtype=np.uint8)
+    gray = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
+    if gray is None:
+        return _preprocess_image(Image.open(image_path))
+    return gray
+
+
+# One in-process Tesseract API per worker thread (a PyTessBaseAPI isn't thread safe)
+_tess = threading.local()
+
+
+def _tess_api():
+    """
+    Persistent tesserocr API for this thread: the traineddata is loaded once
+    per worker instead of spawning tesseract and reloading it for every image.
+    OCR runs on pipeline's long-lived pool, so this holds across requests.
+    """
+    api = getattr(_tess, "api", None)
+    if api is None:
+        kwargs = {
+            "lang": _TESS_LANG,
+            "psm": settings.TESSERACT_PSM,
+            "oem": settings.TESSERACT_OEM,
+        }
+        if settings.TESSDATA_PATH:
+            kwargs["path"] = settings.TESSDATA_PATH
+        api = tesserocr.PyTessBaseAPI(**kwargs)
+        _tess.api = api
+    return api
+
+
 def ocr_image(image_path: Path) -> str:
     """
     Run OCR on a single image and return plain text.
     """
-    img = Image.open(image_path)
-    img = _preprocess_image(img)
+    img = _load_grayscale(image_path)
+
+    if tesserocr is not None:
+        api = _tess_api()
+        api.SetImage(img if isinstance(img, Image.Image) else Image.fromarray(img))
+        return api.GetUTF8Text().strip()
 
-    config = f"--psm {settings.TESSERACT_PSM} --oem {settings.TESSERACT_OEM}"
     text = pytesseract.image_to_string(
         img,
-        lang=settings.TESSERACT_LANG,
-        config=config,
+        lang=_TESS_LANG,
+        config=_TESS_CONFIG,
     )
     return text.strip()
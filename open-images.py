@@ -1,17 +1,39 @@
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # Hardcoded folder path
 folder_path = r"C:\Data\fitin50\Fitness_Challenge_Attachments\2026-01-26"   # Change this to your folder path
 
-while True:
-    image_name = input("Enter image name with extension (or type 'exit' to stop): ")
+# Scan the folder once: name -> full path (no exists() check per name)
+with os.scandir(folder_path) as entries:
+    index = {e.name: e.path for e in entries if e.is_file()}
 
-    if image_name.lower() == "exit":
-        break
 
-    image_path = os.path.join(folder_path, image_name)
+def open_images(names):
+    found = []
+    for image_name in names:
+        image_name = image_name.strip()
+        if not image_name:
+            continue
+        if image_name in index:
+            found.append(index[image_name])
+        else:
+            print(f"Image not found: {image_name}")
 
-    if os.path.exists(image_path):
-        os.startfile(image_path)   # Opens with default image viewer (Windows)
-    else:
-        print(f"Image not found: {image_name}")
+    # Opens with default image viewer (Windows)
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        list(ex.map(os.startfile, found))
+
+
+if not sys.stdin.isatty():
+    # Batch: one image name per line, e.g. `python open-images.py < names.txt`
+    open_images(sys.stdin.read().splitlines())
+else:
+    while True:
+        image_name = input("Enter image name(s) with extension, comma separated (or type 'exit' to stop): ")
+
+        if image_name.lower() == "exit":
+            break
+
+        open_images(image_name.split(","))
@@ -0,0 +1,261 @@
+# pipeline.py
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from config import settings
+from local_images import list_folder_images
+from ocr import ocr_image
+import result_cache
+from llm_client import extract_health_data_batch, LLMExtractionError
+from models import ProcessFolderResponse, ImageResult
+from db import save_results_to_db
+
+logger = logging.getLogger("fitin50")
+
+
+# OCR -> LLM hand-off queue bound: keeps OCR from running far ahead of the LLM
+_OCR_QUEUE_SIZE = 8
+_END = None  # end-of-stream marker for LLM workers
+
+# OCR runs on one long-lived pool shared by all runs, so each worker thread
+# keeps its Tesseract API (ocr._tess_api) across requests
+_ocr_pool = ThreadPoolExecutor(
+    max_workers=max(1, settings.OCR_CONCURRENCY), thread_name_prefix="ocr"
+)
+
+
+def image_content_hash(img_path: Path) -> Optional[str]:
+    """
+    Content hash of the image (see result_cache.file_hash), or None if it can't be read.
+    """
+    try:
+        return result_cache.file_hash(img_path)
+    except OSError:
+        return None
+
+
+def _ocr_one(img_path: Path) -> Optional[str]:
+    """
+    OCR a single image; returns None when OCR fails (the image is skipped).
+    """
+    logger.debug("Processing image: %s", img_path)
+    try:
+        return ocr_image(img_path)
+    except Exception:
+        logger.exception("OCR failed for image %s", img_path)
+        # Skip this image; continue with others
+        return None
+
+
+def _extract_batch(batch: List[tuple]) -> List[ImageResult]:
+    """
+    LLM extraction for a micro-batch of (idx, img_path, text) items,
+    sent as a single request. Failures raise HTTPException and abort the request.
+    """
+    names = ", ".join(img_path.name for _, img_path, _ in batch)
+    try:
+        health_items = extract_health_data_batch([text for _, _, text in batch])
+    except LLMExtractionError as e:
+        logger.warning("LLM extraction failed for image(s) %s: %s", names, e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"LLM JSON extraction failed for image(s) {names}: {e}",
+        )
+    except Exception as e:
+        logger.exception("Unexpected LLM error for image(s) %s", names)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Unexpected LLM error for image(s) {names}: {e}",
+        )
+
+    # Inputs are already-validated models: construct without re-validating
+    return [
+        ImageResult.model_construct(
+            filename=img_path.name,
+            raw_text=text,
+            health_data=health_data,
+        )
+        for (_, img_path, text), health_data in zip(batch, health_items)
+    ]
+
+
+def run_pipeline(image_paths: List[Path]) -> List[ImageResult]:
+    """
+    Two-stage threaded pipeline joined by a bounded queue:
+      OCR workers (long-lived _ocr_pool) -> LLM workers (settings.LLM_CONCURRENCY)
+    Tesseract work on later images overlaps LLM calls for earlier ones, so
+    wall time tends to max(OCR, LLM) rather than their sum. LLM workers send
+    OCR texts in micro-batches (settings.LLM_BATCH_SIZE / LLM_BATCH_WAIT_MS).
+    Images whose content hash is in result_cache skip OCR and LLM entirely.
+    Results keep the input order; images whose OCR failed are left out.
+    The first OCR-stage or LLM failure aborts the run and is re-raised.
+    """
+    if not image_paths:
+        return []
+
+    pending: Queue = Queue()
+    for item in enumerate(image_paths):
+        pending.put(item)
+
+    ocr_done: Queue = Queue(maxsize=_OCR_QUEUE_SIZE)
+    results: List[Optional[ImageResult]] = [None] * len(image_paths)
+    content_hashes: Dict[int, Optional[str]] = {}
+    failures: List[BaseException] = []
+    abort = threading.Event()
+
+    def ocr_stage() -> None:
+        while not abort.is_set():
+            try:
+                idx, img_path = pending.get_nowait()
+            except Empty:
+                return
+
+            try:
+                content_hash = image_content_hash(img_path)
+                cached = result_cache.get(content_hash) if content_hash else None
+                if cached is not None:
+                    # Same bytes seen before: skip both OCR and the LLM
+                    logger.debug("Using cached result for image: %s", img_path)
+                    results[idx] = ImageResult.model_construct(
+                        filename=img_path.name,
+                        raw_text=cached.raw_text,
+                        health_data=cached.health_data,
+                    )
+                    continue
+
+                content_hashes[idx] = content_hash
+                text = _ocr_one(img_path)
+                if text is not None:
+                    ocr_done.put((idx, img_path, text))
+            except BaseException as e:
+                # A dead OCR worker would silently drop its images: fail the run instead
+                failures.append(e)
+                abort.set()
+                return
+
+    def next_batch() -> tuple:
+        """
+        Block for one OCR result, then gather more until the batch is full or
+        LLM_BATCH_WAIT_MS has passed. Returns (batch, end_of_stream).
+        """
+        batch: List[tuple] = []
+        item = ocr_done.get()
+        deadline = time.monotonic() + settings.LLM_BATCH_WAIT_MS / 1000
+        while item is not _END:
+            batch.append(item)
+            if len(batch) >= settings.LLM_BATCH_SIZE:
+                return batch, False
+            try:
+                item = ocr_done.get(timeout=max(0.0, deadline - time.monotonic()))
+            except Empty:
+                return batch, False
+        return batch, True
+
+    def llm_stage() -> None:
+        finished = False
+        while not finished:
+            batch, finished = next_batch()
+            if not batch or abort.is_set():
+                # keep draining so OCR workers never block on a full queue
+                continue
+            try:
+                for (idx, _, _), result in zip(batch, _extract_batch(batch)):
+                    results[idx] = result
+                    if content_hashes.get(idx):
+                        result_cache.put(content_hashes[idx], result)
+            except BaseException as e:
+                failures.append(e)
+                abort.set()
+
+    ocr_workers = min(settings.OCR_CONCURRENCY, len(image_paths))
+    llm_workers = min(settings.LLM_CONCURRENCY, len(image_paths))
+
+    with ThreadPoolExecutor(max_workers=llm_workers) as ex:
+        llm_futures = [ex.submit(llm_stage) for _ in range(llm_workers)]
+        ocr_futures = [_ocr_pool.submit(ocr_stage) for _ in range(ocr_workers)]
+
+        wait(ocr_futures)
+        for _ in range(llm_workers):
+            ocr_done.put(_END)
+        wait(llm_futures)
+
+    # Stage errors are recorded in failures; result() surfaces anything else
+    for f in ocr_futures + llm_futures:
+        f.result()
+
+    if failures:
+        raise failures[0]
+
+    done = [r for r in results if r is not None]
+    # One summary line per run; per-image lines are DEBUG
+    logger.info("Processed %d/%d images", len(done), len(image_paths))
+    return done
+
+
+def run_folder_pipeline(folder_name: str, include_raw: bool = False) -> ProcessFolderResponse:
+    """
+    List the folder's images, run OCR + LLM on them, save/export the results
+    and build the response. Shared by /process-folder and /update_total_points.
+    raw_text is blanked in the response unless include_raw is set.
+    """
+    try:
+        logger.info("Listing images for local folder_name=%s", folder_name)
+        image_paths: List[Path] = list_folder_images(folder_name)
+    except FileNotFoundError as e:
+        logger.warning("Folder not found: %s", e)
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.exception("Failed to list images from local folder")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error reading local folder: {e}",
+        )
+
+    if not image_paths:
+        logger.warning("No images found for folder_name=%s", folder_name)
+        return ProcessFolderResponse(
+            folder_name=folder_name,
+            images_processed=0,
+            results=[],
+        )
+
+    results: List[ImageResult] = run_pipeline(image_paths)
+
+    #Save to Postgres
+    try:
+        inserted_ids = save_results_to_db(folder_name, results)
+        logger.info(
+            "Saved %d rows to Postgres for folder_name=%s",
+            len(inserted_ids),
+            folder_name,
+        )
+    except Exception as e:
+        logger.exception("Failed to save results to Postgres")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error saving results to database: {e}",
+        )
+
+    if not include_raw:
+        # OCR text is bulky and rarely needed by clients; it stays in the result cache
+        results = [
+            ImageResult.model_construct(
+                filename=r.filename, raw_text="", health_data=r.health_data
+            )
+            for r in results
+        ]
+
+    return ProcessFolderResponse(
+        folder_name=folder_name,
+        images_processed=len(results),
+        results=results,
+    )
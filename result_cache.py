@@ -0,0 +1,180 @@
+# result_cache.py
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+import llm_client
+import ocr
+from config import settings
+from models import HealthData, ImageResult
+
+logger = logging.getLogger("fitin50")
+
+# Bump when result post-processing changes (health_from_json_obj, step
+# clamping, points) so results computed by older code stop being served
+CACHE_VERSION = 1
+
+
+def _result_key() -> str:
+    """
+    Everything a cached result depends on besides the image bytes: the LLM
+    model, CACHE_VERSION, and a fingerprint of the prompts, workout points
+    and Tesseract engine/lang/config. Any change makes old rows misses.
+    """
+    fingerprint = hashlib.sha256(
+        "\0".join(
+            (
+                llm_client._EXTRACTION_PROMPT_TEMPLATE,
+                llm_client._BATCH_EXTRACTION_PROMPT_TEMPLATE,
+                repr(sorted(llm_client._WORKOUT_POINTS.items())),
+                "tesserocr" if ocr.tesserocr is not None else "pytesseract",
+                ocr._TESS_LANG,
+                ocr._TESS_CONFIG,
+            )
+        ).encode()
+    ).hexdigest()[:16]
+    return f"{settings.TOGETHER_MODEL}|v{CACHE_VERSION}|{fingerprint}"
+
+
+_RESULT_KEY = _result_key()
+
+# One SQLite connection per thread (pipeline workers read/write concurrently)
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        cache_path = Path(settings.RESULT_CACHE_PATH)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+        conn = sqlite3.connect(cache_path, timeout=30)
+        # WAL: readers don't block the writer (and vice versa)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_results (
+                content_hash TEXT NOT NULL,
+                model        TEXT NOT NULL,  -- _RESULT_KEY: model + pipeline version
+                raw_text     TEXT NOT NULL,
+                health_data  TEXT NOT NULL,
+                PRIMARY KEY (content_hash, model)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path         TEXT PRIMARY KEY,
+                mtime_ns     INTEGER NOT NULL,
+                size         INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            )
+            """
+        )
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _sha256_file(image_path: Path) -> str:
+    # Streamed in chunks through a reused buffer, never the whole file in memory
+    with open(image_path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(1 << 18), b""):
+            h.update(chunk)
+        return h.hexdigest()
+
+
+def file_hash(image_path: Path) -> str:
+    """
+    SHA-256 of the image bytes.
+    An unchanged (path, mtime, size) reuses the stored hash without reading the file.
+    """
+    stat = os.stat(image_path)
+    key = str(image_path)
+
+    try:
+        row = _connect().execute(
+            "SELECT content_hash FROM file_hashes WHERE path = ? AND mtime_ns = ? AND size = ?",
+            (key, stat.st_mtime_ns, stat.st_size),
+        ).fetchone()
+    except sqlite3.Error:
+        logger.warning("Result cache lookup failed for %s", image_path, exc_info=True)
+        row = None
+    if row:
+        return row[0]
+
+    content_hash = _sha256_file(image_path)
+
+    try:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO file_hashes (path, mtime_ns, size, content_hash) VALUES (?, ?, ?, ?)",
+            (key, stat.st_mtime_ns, stat.st_size, content_hash),
+        )
+        conn.commit()
+    except sqlite3.Error:
+        logger.warning("Result cache write failed for %s", image_path, exc_info=True)
+
+    return content_hash
+
+
+def get(content_hash: str) -> Optional[ImageResult]:
+    """
+    Cached OCR + LLM result for this image content, or None.
+    The returned filename is empty: content is shared across file names.
+    """
+    try:
+        row = _connect().execute(
+            "SELECT raw_text, health_data FROM image_results WHERE content_hash = ? AND model = ?",
+            (content_hash, _RESULT_KEY),
+        ).fetchone()
+    except sqlite3.Error:
+        logger.warning("Result cache lookup failed for %s", content_hash, exc_info=True)
+        return None
+
+    if row is None:
+        return None
+
+    raw_text, health_json = row
+    try:
+        health_data = HealthData.model_validate_json(health_json)
+    except ValueError:  # pydantic.ValidationError: corrupt or outdated row
+        logger.warning("Result cache entry unreadable for %s", content_hash, exc_info=True)
+        return None
+
+    return ImageResult.model_construct(
+        filename="",
+        raw_text=raw_text,
+        health_data=health_data,
+    )
+
+
+def put(content_hash: str, result: ImageResult) -> None:
+    """
+    Store the OCR + LLM result for this image content.
+    """
+    try:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO image_results (content_hash, model, raw_text, health_data) VALUES (?, ?, ?, ?)",
+            (
+                content_hash,
+                _RESULT_KEY,
+                result.raw_text,
+                result.health_data.model_dump_json(),
+            ),
+        )
+        conn.commit()
+    except sqlite3.Error:
+        logger.warning("Result cache write failed for %s", content_hash, exc_info=True)